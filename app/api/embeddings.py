@@ -1,4 +1,5 @@
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import ORJSONResponse
 
 from app.models.embedding import (
     DocumentsEmbeddingRequest,
@@ -11,25 +12,22 @@ from app.services.embeddings import get_embeddings_service
 router = APIRouter(prefix="/embeddings", tags=["embeddings"])
 
 
+# Embedding endpoints return a prebuilt response so FastAPI doesn't re-validate
+# every float against response_model (which is kept for the OpenAPI schema).
 @router.post("/query", response_model=EmbeddingResponse)
 async def create_query_embedding(
     request: EmbeddingRequest,
-) -> EmbeddingResponse:
+) -> ORJSONResponse:
     """Create an embedding for a single query using the specified model."""
-    try:
-        service = get_embeddings_service()
-        return await service.embed_query(request.model, request.query)
-    except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Failed to create embedding: {str(e)}",
-        )
+    service = get_embeddings_service()
+    result = await service.embed_query(request.model, request.query)
+    return ORJSONResponse(result.model_dump())
 
 
 @router.post("/documents", response_model=DocumentsEmbeddingResponse)
 async def create_documents_embeddings(
     request: DocumentsEmbeddingRequest,
-) -> DocumentsEmbeddingResponse:
+) -> ORJSONResponse:
     """Create embeddings for a list of documents using the specified model."""
     if not request.documents:
         raise HTTPException(
@@ -37,11 +35,6 @@ async def create_documents_embeddings(
             detail="Documents list cannot be empty",
         )
 
-    try:
-        service = get_embeddings_service()
-        return await service.embed_documents(request.model, request.documents)
-    except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Failed to create embeddings: {str(e)}",
-        )
+    service = get_embeddings_service()
+    result = await service.embed_documents(request.model, request.documents)
+    return ORJSONResponse(result.model_dump())
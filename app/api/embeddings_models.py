@@ -1,6 +1,7 @@
 from fastapi import APIRouter, HTTPException, Response
+from fastapi.responses import ORJSONResponse
 
-from app.core.database import get_pool
+from app.core.database import DbConnection
 from app.models.embeddings_model import (
     EmbeddingsModelCreate,
     EmbeddingsModelResponse,
@@ -21,80 +22,75 @@ router = APIRouter(prefix="/embeddings-models", tags=["embeddings-models"])
 @router.post("", response_model=EmbeddingsModelResponse, status_code=201)
 async def create_model(
     model: EmbeddingsModelCreate,
+    conn: DbConnection,
 ) -> EmbeddingsModelResponse:
     """Create a new embeddings model."""
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        existing = await get_embeddings_model(conn, model.id)
-        if existing:
-            raise HTTPException(
-                status_code=409, detail=f"Model with id '{model.id}' already exists"
-            )
-        return await create_embeddings_model(conn, model)
+    result = await create_embeddings_model(conn, model)
+    if result is None:
+        raise HTTPException(
+            status_code=409, detail=f"Model with id '{model.id}' already exists"
+        )
+    return result
 
 
 @router.put("", response_model=EmbeddingsModelResponse)
 async def upsert_model(
     model: EmbeddingsModelCreate,
     response: Response,
+    conn: DbConnection,
 ) -> EmbeddingsModelResponse:
     """Create or update an embeddings model."""
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        result, created = await upsert_embeddings_model(conn, model)
-        if created:
-            response.status_code = 201
-        return result
+    result, created = await upsert_embeddings_model(conn, model)
+    if created:
+        response.status_code = 201
+    return result
 
 
 @router.get("", response_model=list[EmbeddingsModelResponse])
-async def list_models() -> list[EmbeddingsModelResponse]:
+async def list_models(conn: DbConnection) -> ORJSONResponse:
     """Get all embeddings models."""
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        return await get_all_embeddings_models(conn)
+    models = await get_all_embeddings_models(conn)
+    # Returned as is: response_model only documents the list in the schema
+    return ORJSONResponse([model.model_dump() for model in models])
 
 
 @router.get("/{model_id}", response_model=EmbeddingsModelResponse)
 async def get_model(
     model_id: str,
+    conn: DbConnection,
 ) -> EmbeddingsModelResponse:
     """Get a single embeddings model by ID."""
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        result = await get_embeddings_model(conn, model_id)
-        if result is None:
-            raise HTTPException(
-                status_code=404, detail=f"Model with id '{model_id}' not found"
-            )
-        return result
+    result = await get_embeddings_model(conn, model_id)
+    if result is None:
+        raise HTTPException(
+            status_code=404, detail=f"Model with id '{model_id}' not found"
+        )
+    return result
 
 
 @router.put("/{model_id}", response_model=EmbeddingsModelResponse)
 async def update_model(
     model_id: str,
     model: EmbeddingsModelUpdate,
+    conn: DbConnection,
 ) -> EmbeddingsModelResponse:
     """Update an existing embeddings model."""
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        result = await update_embeddings_model(conn, model_id, model)
-        if result is None:
-            raise HTTPException(
-                status_code=404, detail=f"Model with id '{model_id}' not found"
-            )
-        return result
+    result = await update_embeddings_model(conn, model_id, model)
+    if result is None:
+        raise HTTPException(
+            status_code=404, detail=f"Model with id '{model_id}' not found"
+        )
+    return result
 
 
 @router.delete("/{model_id}", status_code=204)
 async def delete_model(
     model_id: str,
+    conn: DbConnection,
 ) -> None:
     """Delete an embeddings model."""
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        deleted = await delete_embeddings_model(conn, model_id)
-        if not deleted:
-            raise HTTPException(
-                status_code=404, detail=f"Model with id '{model_id}' not found"
-            )
+    deleted = await delete_embeddings_model(conn, model_id)
+    if not deleted:
+        raise HTTPException(
+            status_code=404, detail=f"Model with id '{model_id}' not found"
+        )
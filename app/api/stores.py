@@ -1,7 +1,11 @@
-from fastapi import APIRouter, HTTPException
+from typing import Annotated
 
-from app.core.database import get_pool
+from fastapi import APIRouter, HTTPException, Path
+from fastapi.responses import ORJSONResponse
+
+from app.core.database import DbConnection, DbPool
 from app.models.store import (
+    TABLE_NAME_PATTERN,
     StoreBatchEmbedRequest,
     StoreBatchEmbedResponse,
     StoreCreate,
@@ -27,6 +31,13 @@ from app.services.embeddings_model import get_embeddings_model
 
 router = APIRouter(prefix="/stores", tags=["stores"])
 
+# Rejects ids that could never name a store table before any database work; the
+# longer TABLE_NAME_PATTERN keeps stores created before ids were capped reachable
+StoreId = Annotated[str, Path(pattern=TABLE_NAME_PATTERN)]
+
+# Listing, batch embed and query results are returned as a prebuilt
+# ORJSONResponse, which FastAPI doesn't check against response_model again
+
 
 async def _get_and_validate_model(conn: object, model_id: str) -> EmbeddingsModelResponse:
     """Get and validate that the referenced embeddings model exists."""
@@ -42,118 +53,97 @@ async def _get_and_validate_model(conn: object, model_id: str) -> EmbeddingsMode
 @router.post("", response_model=StoreResponse, status_code=201)
 async def create_store_endpoint(
     store: StoreCreate,
+    conn: DbConnection,
 ) -> StoreResponse:
     """Create a new store and its corresponding embeddings table."""
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        model = await _get_and_validate_model(conn, store.model)
-        existing = await get_store(conn, store.id)
-        if existing:
-            raise HTTPException(
-                status_code=409, detail=f"Store with id '{store.id}' already exists"
-            )
-        return await create_store(conn, store, model.dimensions)
+    model = await _get_and_validate_model(conn, store.model)
+    result = await create_store(conn, store, model.dimensions)
+    if result is None:
+        raise HTTPException(
+            status_code=409, detail=f"Store with id '{store.id}' already exists"
+        )
+    return result
 
 
 @router.get("", response_model=list[StoreResponse])
-async def list_stores() -> list[StoreResponse]:
+async def list_stores(conn: DbConnection) -> ORJSONResponse:
     """Get all stores."""
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        return await get_all_stores(conn)
+    stores = await get_all_stores(conn)
+    return ORJSONResponse([store.model_dump() for store in stores])
 
 
 @router.get("/{store_id}", response_model=StoreResponse)
 async def get_store_endpoint(
-    store_id: str,
+    store_id: StoreId,
+    conn: DbConnection,
 ) -> StoreResponse:
     """Get a single store by ID."""
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        result = await get_store(conn, store_id)
-        if result is None:
-            raise HTTPException(
-                status_code=404, detail=f"Store with id '{store_id}' not found"
-            )
-        return result
+    result = await get_store(conn, store_id)
+    if result is None:
+        raise HTTPException(
+            status_code=404, detail=f"Store with id '{store_id}' not found"
+        )
+    return result
 
 
 @router.put("/{store_id}", response_model=StoreResponse)
 async def update_store_endpoint(
-    store_id: str,
+    store_id: StoreId,
     store: StoreUpdate,
+    conn: DbConnection,
 ) -> StoreResponse:
     """Update an existing store."""
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        if store.model is not None:
-            await _get_and_validate_model(conn, store.model)
-        result = await update_store(conn, store_id, store)
-        if result is None:
-            raise HTTPException(
-                status_code=404, detail=f"Store with id '{store_id}' not found"
-            )
-        return result
+    if store.model is not None:
+        await _get_and_validate_model(conn, store.model)
+    result = await update_store(conn, store_id, store)
+    if result is None:
+        raise HTTPException(
+            status_code=404, detail=f"Store with id '{store_id}' not found"
+        )
+    return result
 
 
 @router.delete("/{store_id}", status_code=204)
 async def delete_store_endpoint(
-    store_id: str,
+    store_id: StoreId,
+    conn: DbConnection,
 ) -> None:
     """Delete a store."""
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        deleted = await delete_store(conn, store_id)
-        if not deleted:
-            raise HTTPException(
-                status_code=404, detail=f"Store with id '{store_id}' not found"
-            )
+    deleted = await delete_store(conn, store_id)
+    if not deleted:
+        raise HTTPException(
+            status_code=404, detail=f"Store with id '{store_id}' not found"
+        )
 
 
 @router.post("/{store_id}/embed", response_model=StoreEmbedResponse)
 async def embed_content_endpoint(
-    store_id: str,
+    store_id: StoreId,
     request: StoreEmbedRequest,
+    pool: DbPool,
 ) -> StoreEmbedResponse:
     """Embed content and store it in the store's table. Idempotent - no duplicates."""
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        # Get the store to find the model
-        store = await get_store(conn, store_id)
-        if store is None:
-            raise HTTPException(
-                status_code=404, detail=f"Store with id '{store_id}' not found"
-            )
-
-        try:
-            result = await embed_content(
-                conn,
-                store_id,
-                store.model,
-                request.content,
-                request.query,
-                request.metadata,
-            )
-            if result is None:
-                raise HTTPException(
-                    status_code=400,
-                    detail="Content cannot be empty",
-                )
-            return result
-        except HTTPException:
-            raise
-        except Exception as e:
-            raise HTTPException(
-                status_code=500,
-                detail=f"Failed to embed content: {str(e)}",
-            )
+    result = await embed_content(
+        pool,
+        store_id,
+        request.content,
+        request.query,
+        request.metadata,
+    )
+    if result is None:
+        raise HTTPException(
+            status_code=400,
+            detail="Content cannot be empty",
+        )
+    return result
 
 
 @router.post("/{store_id}/embed/batch", response_model=StoreBatchEmbedResponse)
 async def embed_content_batch_endpoint(
-    store_id: str,
+    store_id: StoreId,
     request: StoreBatchEmbedRequest,
-) -> StoreBatchEmbedResponse:
+    pool: DbPool,
+) -> ORJSONResponse:
     """Embed multiple items and store them in the store's table. Idempotent - no duplicates."""
     if not request.items:
         raise HTTPException(
@@ -161,56 +151,27 @@ async def embed_content_batch_endpoint(
             detail="Items list cannot be empty",
         )
 
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        # Get the store to find the model
-        store = await get_store(conn, store_id)
-        if store is None:
-            raise HTTPException(
-                status_code=404, detail=f"Store with id '{store_id}' not found"
-            )
-
-        try:
-            return await embed_content_batch(
-                conn,
-                store_id,
-                store.model,
-                request.items,
-            )
-        except Exception as e:
-            raise HTTPException(
-                status_code=500,
-                detail=f"Failed to embed content: {str(e)}",
-            )
+    result = await embed_content_batch(
+        pool,
+        store_id,
+        request.items,
+    )
+    return ORJSONResponse(result.model_dump())
 
 
 @router.post("/{store_id}/query", response_model=StoreQueryResponse)
 async def query_store_endpoint(
-    store_id: str,
+    store_id: StoreId,
     request: StoreQueryRequest,
-) -> StoreQueryResponse:
+    pool: DbPool,
+) -> ORJSONResponse:
     """Query the store for the most similar content using vector similarity search."""
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        # Get the store to find the model
-        store = await get_store(conn, store_id)
-        if store is None:
-            raise HTTPException(
-                status_code=404, detail=f"Store with id '{store_id}' not found"
-            )
-
-        try:
-            return await query_store(
-                conn,
-                store_id,
-                store.model,
-                request.query,
-                limit=request.limit,
-                max_distance=request.distance,
-                metadata_filters=request.metadata,
-            )
-        except Exception as e:
-            raise HTTPException(
-                status_code=500,
-                detail=f"Failed to query store: {str(e)}",
-            )
+    result = await query_store(
+        pool,
+        store_id,
+        request.query,
+        limit=request.limit,
+        max_distance=request.distance,
+        metadata_filters=request.metadata,
+    )
+    return ORJSONResponse(result.model_dump())
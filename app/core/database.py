@@ -1,78 +1,294 @@
+import struct
+from collections.abc import AsyncGenerator, AsyncIterator, Sequence
+from contextlib import asynccontextmanager
+from typing import Annotated
+
 import asyncpg
+from fastapi import Depends, Request
+
+from app.core.config import get_settings
+
+settings = get_settings()
+
+
+def _encode_vector(value: Sequence[float]) -> bytes:
+    """Encode a pgvector vector in binary format: dim, unused, float4 values."""
+    return struct.pack(f">HH{len(value)}f", len(value), 0, *value)
+
+
+def _decode_vector(data: bytes) -> list[float]:
+    """Decode a pgvector vector from binary format."""
+    (dim,) = struct.unpack_from(">H", data)
+    return list(struct.unpack_from(f">{dim}f", data, 4))
+
+
+def _encode_halfvec(value: Sequence[float]) -> bytes:
+    """Encode a pgvector halfvec in binary format: dim, unused, float2 values."""
+    return struct.pack(f">HH{len(value)}e", len(value), 0, *value)
+
+
+def _decode_halfvec(data: bytes) -> list[float]:
+    """Decode a pgvector halfvec from binary format."""
+    (dim,) = struct.unpack_from(">H", data)
+    return list(struct.unpack_from(f">{dim}e", data, 4))
+
+
+async def _init_connection(conn: asyncpg.Connection) -> None:
+    """Register binary codecs so vectors are sent as raw floats, not text literals."""
+    codecs = [
+        ("vector", _encode_vector, _decode_vector),
+        ("halfvec", _encode_halfvec, _decode_halfvec),
+    ]
+    for typename, encoder, decoder in codecs:
+        try:
+            await conn.set_type_codec(
+                typename,
+                encoder=encoder,
+                decoder=decoder,
+                schema="public",
+                format="binary",
+            )
+        except ValueError:
+            # Type doesn't exist yet - init_db creates the extension, then
+            # recycles the pool's connections so they pick up the codec
+            pass
+
+
+async def create_pool() -> asyncpg.Pool:
+    """Create the database connection pool."""
+    return await asyncpg.create_pool(
+        settings.DATABASE_URL,
+        init=_init_connection,
+        min_size=settings.DB_POOL_MIN,
+        max_size=settings.DB_POOL_MAX,
+        statement_cache_size=settings.DB_STATEMENT_CACHE_SIZE,
+        max_inactive_connection_lifetime=settings.DB_MAX_INACTIVE_CONN_LIFETIME,
+        command_timeout=settings.DB_COMMAND_TIMEOUT,
+    )
+
+
+class PoolTimeoutError(Exception):
+    """Raised when no pooled connection frees up within DB_POOL_ACQUIRE_TIMEOUT."""
+
+    def __init__(self) -> None:
+        super().__init__("Timed out waiting for a database connection")
+
 
-from app.core.config import settings
+@asynccontextmanager
+async def acquire(pool: asyncpg.Pool) -> AsyncIterator[asyncpg.Connection]:
+    """Acquire a pooled connection, giving up after DB_POOL_ACQUIRE_TIMEOUT."""
+    try:
+        conn = await pool.acquire(timeout=settings.DB_POOL_ACQUIRE_TIMEOUT)
+    except TimeoutError:
+        raise PoolTimeoutError() from None
+    try:
+        yield conn
+    finally:
+        await pool.release(conn)
 
-_pool: asyncpg.Pool | None = None
 
+async def get_conn(request: Request) -> AsyncGenerator[asyncpg.Connection]:
+    """Acquire a connection from the app's pool for the duration of a request."""
+    async with acquire(request.app.state.pool) as conn:
+        yield conn
 
-async def get_pool() -> asyncpg.Pool:
-    """Get or create the database connection pool."""
-    global _pool
-    if _pool is None:
-        _pool = await asyncpg.create_pool(settings.DATABASE_URL)
-    return _pool
 
+# Dependency for route handlers that need a database connection
+DbConnection = Annotated[asyncpg.Connection, Depends(get_conn)]
 
-async def get_db() -> asyncpg.Connection:
-    """Get a database connection from the pool."""
-    pool = await get_pool()
-    return await pool.acquire()
 
+def get_pool(request: Request) -> asyncpg.Pool:
+    """Get the app's connection pool."""
+    pool: asyncpg.Pool = request.app.state.pool
+    return pool
 
-async def release_db(conn: asyncpg.Connection) -> None:
-    """Release a database connection back to the pool."""
-    pool = await get_pool()
-    await pool.release(conn)
 
+# Dependency for route handlers that wait on other services between queries,
+# so they only hold a connection while they talk to the database
+DbPool = Annotated[asyncpg.Pool, Depends(get_pool)]
 
-async def init_db() -> None:
+
+async def init_db(pool: asyncpg.Pool) -> None:
     """Create database tables if they don't exist."""
-    pool = await get_pool()
-    async with pool.acquire() as conn:
+    # The pool's DB_COMMAND_TIMEOUT is sized for requests; migrations can wait
+    # on another worker's lock and build indexes on large existing stores
+    timeout = settings.DB_MIGRATION_TIMEOUT
+    async with pool.acquire() as conn, conn.transaction():
+        # Serialize schema setup when several worker processes start at once
+        await conn.execute(
+            "SELECT pg_advisory_xact_lock(hashtext('init_db'))", timeout=timeout
+        )
         # Enable pgvector extension
-        await conn.execute("CREATE EXTENSION IF NOT EXISTS vector")
-        await conn.execute("""
+        await conn.execute("CREATE EXTENSION IF NOT EXISTS vector", timeout=timeout)
+        await conn.execute(
+            """
             CREATE TABLE IF NOT EXISTS embeddings_models (
                 id TEXT PRIMARY KEY,
                 description TEXT NOT NULL,
                 dimensions INTEGER NOT NULL DEFAULT 1024
             )
-        """)
+        """,
+            timeout=timeout,
+        )
         # Add dimensions column to existing tables (migration)
-        await conn.execute("""
+        await conn.execute(
+            """
             ALTER TABLE embeddings_models
             ADD COLUMN IF NOT EXISTS dimensions INTEGER NOT NULL DEFAULT 1024
-        """)
-        await conn.execute("""
+        """,
+            timeout=timeout,
+        )
+        await conn.execute(
+            """
             CREATE TABLE IF NOT EXISTS stores (
                 id TEXT PRIMARY KEY,
                 model TEXT NOT NULL REFERENCES embeddings_models(id),
-                description TEXT
+                description TEXT,
+                embedding_type TEXT NOT NULL DEFAULT 'vector'
             )
-        """)
-
-        # Migration: Add unique constraint on content column for all existing store tables
-        store_rows = await conn.fetch("SELECT id FROM stores")
-        for row in store_rows:
-            table_name = row["id"]
-            # Check if table exists and add unique constraint if missing
-            await conn.execute(f"""
-                DO $$
-                BEGIN
-                    IF NOT EXISTS (
-                        SELECT 1 FROM pg_constraint
-                        WHERE conname = '{table_name}_content_key'
-                    ) THEN
-                        ALTER TABLE {table_name}
-                        ADD CONSTRAINT {table_name}_content_key UNIQUE (content);
-                    END IF;
-                END $$;
-            """)
+        """,
+            timeout=timeout,
+        )
+        # Add embedding_type column to existing tables (migration)
+        await conn.execute(
+            """
+            ALTER TABLE stores
+            ADD COLUMN IF NOT EXISTS embedding_type TEXT NOT NULL DEFAULT 'vector'
+        """,
+            timeout=timeout,
+        )
+        await conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS query_cache (
+                store_id TEXT NOT NULL REFERENCES stores(id) ON DELETE CASCADE,
+                query_hash BYTEA NOT NULL,
+                results JSONB NOT NULL,
+                created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                PRIMARY KEY (store_id, query_hash)
+            )
+        """,
+            timeout=timeout,
+        )
+        # Lets query_store evict expired cache entries without a full scan
+        await conn.execute(
+            """
+            CREATE INDEX IF NOT EXISTS query_cache_created_at_idx
+            ON query_cache (created_at)
+        """,
+            timeout=timeout,
+        )
 
+        # Migration: Add unique constraint on content column for all existing store
+        # tables. Runs as a single DO block so startup costs one round trip
+        # regardless of the number of stores; identifiers are quoted server-side.
+        # Store tables are created with unquoted names, so they are lower-case.
+        # The constraint is looked up by kind rather than by name, since Postgres
+        # truncates generated names for long table names.
+        await conn.execute(
+            """
+            DO $$
+            DECLARE
+                store_table TEXT;
+            BEGIN
+                FOR store_table IN
+                    SELECT lower(s.id)
+                    FROM stores s
+                    JOIN pg_attribute a
+                        ON a.attrelid = to_regclass(quote_ident(lower(s.id)))
+                        AND a.attname = 'content'
+                    WHERE NOT EXISTS (
+                        SELECT 1 FROM pg_constraint c
+                        WHERE c.conrelid = a.attrelid
+                            AND c.contype = 'u'
+                            AND c.conkey = ARRAY[a.attnum]
+                    )
+                LOOP
+                    EXECUTE format(
+                        'ALTER TABLE %I ADD UNIQUE (content)', store_table
+                    );
+                END LOOP;
+            END $$;
+        """,
+            timeout=timeout,
+        )
+
+        # Migration: Store tables created with a JSON metadata column are converted
+        # to JSONB and given the GIN index query_store's containment filter uses.
+        # Runs before the HNSW migration: changing the column type rewrites the
+        # table and rebuilds its indexes, so an HNSW index would be built twice
+        await conn.execute(
+            """
+            DO $$
+            DECLARE
+                store_table TEXT;
+            BEGIN
+                FOR store_table IN
+                    SELECT lower(s.id)
+                    FROM stores s
+                    JOIN pg_attribute a
+                        ON a.attrelid = to_regclass(quote_ident(lower(s.id)))
+                        AND a.attname = 'metadata'
+                    WHERE a.atttypid = 'json'::regtype
+                LOOP
+                    EXECUTE format(
+                        'ALTER TABLE %I ALTER COLUMN metadata TYPE JSONB '
+                        'USING metadata::jsonb',
+                        store_table
+                    );
+                    EXECUTE format(
+                        'CREATE INDEX ON %I USING gin (metadata jsonb_path_ops)',
+                        store_table
+                    );
+                END LOOP;
+            END $$;
+        """,
+            timeout=timeout,
+        )
+
+        # Migration: Add the HNSW index to store tables created before stores were
+        # indexed. Dimensions come from the column's type modifier; columns over
+        # pgvector's index limit (2000 for vector, 4000 for halfvec) are skipped.
+        # Tables with any HNSW index are skipped, and Postgres names the new index
+        # so it can't collide with another one on long table names.
+        await conn.execute(
+            f"""
+            DO $$
+            DECLARE
+                store_table TEXT;
+                store_type TEXT;
+                store_dimensions INTEGER;
+            BEGIN
+                FOR store_table, store_type, store_dimensions IN
+                    SELECT lower(s.id), s.embedding_type, a.atttypmod
+                    FROM stores s
+                    JOIN pg_attribute a
+                        ON a.attrelid = to_regclass(quote_ident(lower(s.id)))
+                        AND a.attname = 'embedding'
+                    WHERE NOT EXISTS (
+                        SELECT 1
+                        FROM pg_index i
+                        JOIN pg_class c ON c.oid = i.indexrelid
+                        JOIN pg_am am ON am.oid = c.relam
+                        WHERE i.indrelid = a.attrelid AND am.amname = 'hnsw'
+                    )
+                LOOP
+                    IF store_dimensions > 0 AND store_dimensions <= CASE store_type
+                        WHEN 'vector' THEN 2000 WHEN 'halfvec' THEN 4000 ELSE 0 END
+                    THEN
+                        EXECUTE format(
+                            'CREATE INDEX ON %I '
+                            'USING hnsw (embedding %s) '
+                            'WITH (m = {settings.HNSW_M}, '
+                            'ef_construction = {settings.HNSW_EF_CONSTRUCTION})',
+                            store_table,
+                            store_type || '_cosine_ops'
+                        );
+                    END IF;
+                END LOOP;
+            END $$;
+        """,
+            timeout=timeout,
+        )
 
-async def close_db() -> None:
-    """Close the database connection pool."""
-    global _pool
-    if _pool is not None:
-        await _pool.close()
-        _pool = None
+    # Connections opened before the vector extension existed have no codecs
+    await pool.expire_connections()
@@ -2,11 +2,17 @@ import logging
 from collections.abc import AsyncGenerator
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import ORJSONResponse
 
 from app.api.api import api_router
-from app.core.config import settings
-from app.core.database import close_db, init_db
+from app.core.config import get_settings
+from app.core.database import PoolTimeoutError, create_pool, init_db
+from app.services.embeddings import close_embeddings_service, get_embeddings_service
+from app.services.embeddings_model import get_all_embeddings_models
+from app.services.store import StoreNotFoundError
+
+settings = get_settings()
 
 # Configure logging
 logging.basicConfig(
@@ -16,14 +22,24 @@ logging.basicConfig(
 
 @asynccontextmanager
 async def lifespan(app: FastAPI) -> AsyncGenerator[None]:
-    """Initialize database on startup and close on shutdown."""
-    await init_db()
+    """Initialize database and embedding clients on startup, close on shutdown."""
+    pool = await create_pool()
+    app.state.pool = pool
+    await init_db(pool)
+
+    # Pre-warm clients for all registered models so the first request skips setup
+    async with pool.acquire() as conn:
+        models = await get_all_embeddings_models(conn)
+    await get_embeddings_service().warm_up([model.id for model in models])
+
     yield
-    await close_db()
+    await close_embeddings_service()
+    await pool.close()
 
 
 app = FastAPI(
     lifespan=lifespan,
+    default_response_class=ORJSONResponse,
     title=settings.PROJECT_NAME,
     version=settings.VERSION,
     description="FastAPI service for managing embeddings models",
@@ -33,6 +49,29 @@ app = FastAPI(
 app.include_router(api_router, prefix=settings.API_V1_STR)
 
 
+@app.exception_handler(StoreNotFoundError)
+async def store_not_found_handler(
+    request: Request, exc: StoreNotFoundError
+) -> ORJSONResponse:
+    return ORJSONResponse(status_code=404, content={"detail": str(exc)})
+
+
+@app.exception_handler(PoolTimeoutError)
+async def pool_timeout_handler(
+    request: Request, exc: PoolTimeoutError
+) -> ORJSONResponse:
+    return ORJSONResponse(
+        status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "1"}
+    )
+
+
+@app.exception_handler(Exception)
+async def unhandled_exception_handler(
+    request: Request, exc: Exception
+) -> ORJSONResponse:
+    return ORJSONResponse(status_code=500, content={"detail": f"Request failed: {exc}"})
+
+
 @app.get("/")
 async def root() -> dict[str, str]:
     return {"message": "Embeddings Service", "version": settings.VERSION}
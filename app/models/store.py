@@ -1,10 +1,18 @@
 from pydantic import BaseModel, Field
 
+# Store ids double as table names: a Postgres identifier of at most 63 characters
+TABLE_NAME_PATTERN = r"^[a-zA-Z_][a-zA-Z0-9_]{0,62}$"
+# New store ids also leave room for the longest suffix of the table's index
+# names ("_embedding_idx"), which Postgres would otherwise truncate
+STORE_ID_PATTERN = r"^[a-zA-Z_][a-zA-Z0-9_]{0,48}$"
+
 
 class StoreCreate(BaseModel):
     """Schema for creating a store."""
 
-    id: str = Field(..., description="Unique identifier for the store")
+    id: str = Field(
+        ..., description="Unique identifier for the store", pattern=STORE_ID_PATTERN
+    )
     model: str = Field(..., description="Reference to embeddings_models.id")
     description: str | None = Field(None, description="Optional description of the store")
 
@@ -62,7 +70,10 @@ class StoreQueryRequest(BaseModel):
     query: str = Field(..., description="Query text to search for")
     limit: int = Field(10, ge=1, le=100, description="Maximum number of results to return")
     distance: float | None = Field(None, ge=0, le=2, description="Maximum cosine distance (filters out results above this value)")
-    metadata: dict | None = Field(None, description="Optional metadata equality filters")
+    metadata: dict | None = Field(
+        None,
+        description="Optional metadata filters; matches records whose metadata contains them",
+    )
 
 
 class StoreQueryResult(BaseModel):
@@ -1,58 +1,258 @@
-from langchain_ollama import OllamaEmbeddings
+import asyncio
+import functools
+import hashlib
+import logging
+import re
+from array import array
+
+import httpx
+import orjson
+from cachetools import LRUCache
 from vertexai.language_models import TextEmbeddingInput, TextEmbeddingModel
 
-from app.core.config import settings
+from app.core.config import get_settings
 from app.models.embedding import (
     DocumentEmbedding,
     DocumentsEmbeddingResponse,
     EmbeddingResponse,
 )
 
+settings = get_settings()
+
+logger = logging.getLogger(__name__)
+
 # Known Vertex AI embedding models
 VERTEX_AI_MODELS = {"text-embedding-005", "text-embedding-004", "text-multilingual-embedding-002"}
 
+# Most instances Vertex AI accepts in one embeddings request
+VERTEX_AI_MAX_BATCH_SIZE = 250
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
 
 class EmbeddingsService:
-    """Service for creating embeddings using Ollama or Vertex AI models."""
+    """Service for creating embeddings using Ollama or Vertex AI models.
 
-    def __init__(self, ollama_base_url: str = "http://localhost:11434"):
-        self._ollama_base_url = ollama_base_url
-        self._ollama_models: dict[str, OllamaEmbeddings] = {}
+    Vectors come straight from the model backend, so responses are built with
+    model_construct rather than validating every float.
+    """
+
+    def __init__(
+        self,
+        ollama_base_url: str = "http://localhost:11434",
+        max_connections: int = 100,
+        max_keepalive_connections: int = 50,
+        batch_window_ms: float = 2.0,
+        max_batch_size: int = 64,
+        cache_size: int = 10000,
+        cache_normalize: bool = False,
+    ):
         self._vertex_models: dict[str, TextEmbeddingModel] = {}
+        # Serializes Vertex AI client creation so concurrent first requests for
+        # a model build a single client
+        self._models_lock = asyncio.Lock()
+        # Recently computed embeddings, keyed by model, task type and text hash.
+        # Stored as packed doubles: about 8 KB for 1024 dimensions instead of
+        # the 33 KB a list of float objects takes, with values unchanged
+        self._cache: LRUCache[tuple[str, str, bytes], array[float]] = LRUCache(
+            maxsize=cache_size
+        )
+        # Share cache entries between texts that differ only in case and whitespace
+        self._cache_normalize = cache_normalize
+        # Queries waiting to be embedded together, per model
+        self._batch_window = batch_window_ms / 1000
+        self._max_batch_size = max_batch_size
+        self._pending: dict[str, list[tuple[str, asyncio.Future[list[float]]]]] = {}
+        self._flush_handles: dict[str, asyncio.TimerHandle] = {}
+        self._flush_tasks: set[asyncio.Task[None]] = set()
+        # Queries waiting for an embedding, by cache key, so duplicates share one
+        self._inflight: dict[tuple[str, str, bytes], asyncio.Future[list[float]]] = {}
+        # One client for every Ollama model so keep-alive connections are reused
+        # across models and requests
+        self._ollama_client = httpx.AsyncClient(
+            base_url=ollama_base_url,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections,
+            ),
+            timeout=None,
+        )
 
     def _is_vertex_model(self, model_id: str) -> bool:
         """Check if model_id is a Vertex AI model."""
         return model_id in VERTEX_AI_MODELS
 
-    def _get_ollama_model(self, model_id: str) -> OllamaEmbeddings:
-        """Get or create an Ollama embeddings instance."""
-        if model_id not in self._ollama_models:
-            self._ollama_models[model_id] = OllamaEmbeddings(
-                model=model_id,
-                base_url=self._ollama_base_url,
-            )
-        return self._ollama_models[model_id]
-
-    def _get_vertex_model(self, model_id: str) -> TextEmbeddingModel:
+    async def _get_vertex_model(self, model_id: str) -> TextEmbeddingModel:
         """Get or create a Vertex AI embeddings model."""
         if model_id not in self._vertex_models:
-            self._vertex_models[model_id] = TextEmbeddingModel.from_pretrained(model_id)
+            async with self._models_lock:
+                if model_id not in self._vertex_models:
+                    # from_pretrained resolves the model over blocking HTTP calls
+                    self._vertex_models[model_id] = await asyncio.to_thread(
+                        TextEmbeddingModel.from_pretrained, model_id
+                    )
         return self._vertex_models[model_id]
 
-    async def embed_query(self, model_id: str, query: str) -> EmbeddingResponse:
-        """Create an embedding for a single query."""
+    async def _ensure_model(self, model_id: str) -> None:
+        """Create the client for a model if it doesn't exist yet."""
+        # Ollama models share the service's HTTP client, so only Vertex AI
+        # models have a client to create
+        if self._is_vertex_model(model_id):
+            await self._get_vertex_model(model_id)
+
+    async def warm_up(self, model_ids: list[str]) -> None:
+        """Create clients for the given models ahead of the first request."""
+        for model_id in model_ids:
+            try:
+                await self._ensure_model(model_id)
+            except Exception:
+                logger.warning("Failed to warm up model '%s'", model_id, exc_info=True)
+
+    async def aclose(self) -> None:
+        """Stop pending query batches and close the shared Ollama HTTP client."""
+        for handle in self._flush_handles.values():
+            handle.cancel()
+        self._flush_handles.clear()
+        for pending in self._pending.values():
+            for _, future in pending:
+                future.cancel()
+        self._pending.clear()
+        for task in self._flush_tasks:
+            task.cancel()
+        await asyncio.gather(*self._flush_tasks, return_exceptions=True)
+        await self._ollama_client.aclose()
+
+    async def _embed(
+        self, model_id: str, texts: list[str], task_type: str
+    ) -> list[list[float]]:
+        """Embed texts with the model's backend. task_type only applies to Vertex AI."""
         if self._is_vertex_model(model_id):
-            vertex_model = self._get_vertex_model(model_id)
+            vertex_model = await self._get_vertex_model(model_id)
             inputs: list[str | TextEmbeddingInput] = [
-                TextEmbeddingInput(query, "RETRIEVAL_QUERY")
+                TextEmbeddingInput(text, task_type) for text in texts
             ]
-            result = vertex_model.get_embeddings(inputs)
-            embedding = result[0].values
+            # Larger batches are split into concurrent requests within the API limit
+            chunks = await asyncio.gather(
+                *(
+                    vertex_model.get_embeddings_async(
+                        inputs[i : i + VERTEX_AI_MAX_BATCH_SIZE]
+                    )
+                    for i in range(0, len(inputs), VERTEX_AI_MAX_BATCH_SIZE)
+                )
+            )
+            return [r.values for chunk in chunks for r in chunk]
+
+        # /api/embed embeds the whole batch in a single request
+        response = await self._ollama_client.post(
+            "/api/embed", json={"model": model_id, "input": texts}
+        )
+        if response.is_error:
+            # Ollama explains failures such as an unknown model in the body's
+            # "error" field, which raise_for_status would leave out
+            try:
+                error = orjson.loads(response.content).get("error")
+            except (orjson.JSONDecodeError, AttributeError):
+                error = None
+            raise httpx.HTTPStatusError(
+                f"Ollama returned {response.status_code}: "
+                f"{error or response.reason_phrase}",
+                request=response.request,
+                response=response,
+            )
+        embeddings: list[list[float]] = orjson.loads(response.content)["embeddings"]
+        return embeddings
+
+    def _cache_key(
+        self, model_id: str, text: str, task_type: str
+    ) -> tuple[str, str, bytes]:
+        """Build the embedding cache key for a text."""
+        if self._cache_normalize:
+            text = _WHITESPACE_RE.sub(" ", text.strip()).casefold()
+        return (model_id, task_type, hashlib.sha256(text.encode()).digest())
+
+    def _start_flush(self, model_id: str) -> None:
+        """Send the queries pending for a model to the backend as one batch."""
+        handle = self._flush_handles.pop(model_id, None)
+        if handle is not None:
+            handle.cancel()
+        batch = self._pending.pop(model_id, [])
+        if batch:
+            task = asyncio.create_task(self._flush(model_id, batch))
+            self._flush_tasks.add(task)
+            task.add_done_callback(self._flush_tasks.discard)
+
+    async def _flush(
+        self, model_id: str, batch: list[tuple[str, asyncio.Future[list[float]]]]
+    ) -> None:
+        """Embed a batch of queries and resolve each caller's future."""
+        try:
+            embeddings = await self._embed(
+                model_id, [query for query, _ in batch], "RETRIEVAL_QUERY"
+            )
+            if len(embeddings) != len(batch):
+                raise ValueError(
+                    f"Expected {len(batch)} embeddings, got {len(embeddings)}"
+                )
+        except Exception as e:
+            if len(batch) > 1:
+                # One caller's bad input shouldn't fail the others batched with
+                # it: retry each query alone so everyone gets their own outcome
+                await asyncio.gather(*(self._flush(model_id, [item]) for item in batch))
+                return
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), embedding in zip(batch, embeddings, strict=True):
+            if not future.done():
+                future.set_result(embedding)
+
+    def _enqueue_query(
+        self, model_id: str, query: str, cache_key: tuple[str, str, bytes]
+    ) -> asyncio.Future[list[float]]:
+        """Add a query to the model's pending batch and return its future."""
+        loop = asyncio.get_running_loop()
+        future: asyncio.Future[list[float]] = loop.create_future()
+        self._inflight[cache_key] = future
+        future.add_done_callback(functools.partial(self._query_done, cache_key))
+        pending = self._pending.setdefault(model_id, [])
+        pending.append((query, future))
+        if len(pending) >= self._max_batch_size:
+            self._start_flush(model_id)
+        elif model_id not in self._flush_handles:
+            self._flush_handles[model_id] = loop.call_later(
+                self._batch_window, self._start_flush, model_id
+            )
+        return future
+
+    def _query_done(
+        self, cache_key: tuple[str, str, bytes], future: asyncio.Future[list[float]]
+    ) -> None:
+        """Stop sharing a finished query and cache its embedding."""
+        self._inflight.pop(cache_key, None)
+        if not future.cancelled() and future.exception() is None:
+            self._cache[cache_key] = array("d", future.result())
+
+    async def embed_query(self, model_id: str, query: str) -> EmbeddingResponse:
+        """Create an embedding for a single query.
+
+        Concurrent queries for the same model are collected for up to the batch
+        window and embedded with a single backend call. Identical queries in
+        flight at the same time share one result.
+        """
+        cache_key = self._cache_key(model_id, query, "RETRIEVAL_QUERY")
+        cached = self._cache.get(cache_key)
+        if cached is not None:
+            embedding = cached.tolist()
         else:
-            ollama_model = self._get_ollama_model(model_id)
-            embedding = await ollama_model.aembed_query(query)
+            future = self._inflight.get(cache_key)
+            if future is None:
+                future = self._enqueue_query(model_id, query, cache_key)
+            # Shielded so one cancelled caller doesn't fail the others sharing it
+            embedding = await asyncio.shield(future)
 
-        return EmbeddingResponse(
+        return EmbeddingResponse.model_construct(
             model=model_id,
             embedding=embedding,
             dimensions=len(embedding),
@@ -61,26 +261,35 @@ class EmbeddingsService:
     async def embed_documents(
         self, model_id: str, documents: list[str]
     ) -> DocumentsEmbeddingResponse:
-        """Create embeddings for a list of documents."""
-        if self._is_vertex_model(model_id):
-            vertex_model = self._get_vertex_model(model_id)
-            inputs: list[str | TextEmbeddingInput] = [
-                TextEmbeddingInput(doc, "RETRIEVAL_DOCUMENT") for doc in documents
-            ]
-            result = vertex_model.get_embeddings(inputs)
-            embeddings = [r.values for r in result]
-        else:
-            ollama_model = self._get_ollama_model(model_id)
-            embeddings = await ollama_model.aembed_documents(documents)
+        """Create embeddings for a list of documents.
+
+        Only documents missing from the cache are sent to the backend.
+        """
+        cache_keys = [
+            self._cache_key(model_id, doc, "RETRIEVAL_DOCUMENT") for doc in documents
+        ]
+        cached: list[list[float] | None] = []
+        for key in cache_keys:
+            hit = self._cache.get(key)
+            cached.append(None if hit is None else hit.tolist())
+        missing = [i for i, emb in enumerate(cached) if emb is None]
+        if missing:
+            computed = await self._embed(
+                model_id, [documents[i] for i in missing], "RETRIEVAL_DOCUMENT"
+            )
+            for i, emb in zip(missing, computed, strict=True):
+                cached[i] = emb
+                self._cache[cache_keys[i]] = array("d", emb)
+        embeddings = [emb for emb in cached if emb is not None]
 
         document_embeddings = [
-            DocumentEmbedding(index=i, embedding=emb)
+            DocumentEmbedding.model_construct(index=i, embedding=emb)
             for i, emb in enumerate(embeddings)
         ]
 
         dimensions = len(embeddings[0]) if embeddings else 0
 
-        return DocumentsEmbeddingResponse(
+        return DocumentsEmbeddingResponse.model_construct(
             model=model_id,
             embeddings=document_embeddings,
             dimensions=dimensions,
@@ -88,13 +297,22 @@ class EmbeddingsService:
         )
 
 
-# Global service instance
-_embeddings_service: EmbeddingsService | None = None
+@functools.lru_cache(maxsize=1)
+def get_embeddings_service() -> EmbeddingsService:
+    """Get the global embeddings service instance, created on first use."""
+    return EmbeddingsService(
+        ollama_base_url=settings.OLLAMA_URL,
+        max_connections=settings.OLLAMA_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.OLLAMA_MAX_KEEPALIVE_CONNECTIONS,
+        batch_window_ms=settings.EMBEDDING_BATCH_WINDOW_MS,
+        max_batch_size=settings.EMBEDDING_MAX_BATCH_SIZE,
+        cache_size=settings.EMBEDDING_CACHE_SIZE,
+        cache_normalize=settings.EMBEDDING_CACHE_NORMALIZE,
+    )
 
 
-def get_embeddings_service() -> EmbeddingsService:
-    """Get or create the global embeddings service instance."""
-    global _embeddings_service
-    if _embeddings_service is None:
-        _embeddings_service = EmbeddingsService(ollama_base_url=settings.OLLAMA_URL)
-    return _embeddings_service
+async def close_embeddings_service() -> None:
+    """Close the global embeddings service instance."""
+    if get_embeddings_service.cache_info().currsize:
+        await get_embeddings_service().aclose()
+        get_embeddings_service.cache_clear()
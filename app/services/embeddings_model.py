@@ -9,15 +9,21 @@ from app.models.embeddings_model import (
 
 async def create_embeddings_model(
     conn: asyncpg.Connection, model: EmbeddingsModelCreate
-) -> EmbeddingsModelResponse:
-    """Create a new embeddings model."""
-    await conn.execute(
-        "INSERT INTO embeddings_models (id, description, dimensions) VALUES ($1, $2, $3)",
+) -> EmbeddingsModelResponse | None:
+    """Create a new embeddings model. Returns None if a model with the same ID exists."""
+    row = await conn.fetchrow(
+        """
+        INSERT INTO embeddings_models (id, description, dimensions) VALUES ($1, $2, $3)
+        ON CONFLICT (id) DO NOTHING
+        RETURNING id, description, dimensions
+        """,
         model.id,
         model.description,
         model.dimensions,
     )
-    return EmbeddingsModelResponse(id=model.id, description=model.description, dimensions=model.dimensions)
+    if row is None:
+        return None
+    return EmbeddingsModelResponse(id=row["id"], description=row["description"], dimensions=row["dimensions"])
 
 
 async def get_embeddings_model(
@@ -38,8 +44,11 @@ async def get_all_embeddings_models(
 ) -> list[EmbeddingsModelResponse]:
     """Get all embeddings models."""
     rows = await conn.fetch("SELECT id, description, dimensions FROM embeddings_models")
+    # model_construct: the rows were validated when the models were saved
     return [
-        EmbeddingsModelResponse(id=row["id"], description=row["description"], dimensions=row["dimensions"])
+        EmbeddingsModelResponse.model_construct(
+            id=row["id"], description=row["description"], dimensions=row["dimensions"]
+        )
         for row in rows
     ]
 
@@ -48,31 +57,31 @@ async def update_embeddings_model(
     conn: asyncpg.Connection, model_id: str, model: EmbeddingsModelUpdate
 ) -> EmbeddingsModelResponse | None:
     """Update an existing embeddings model."""
-    # First get current values
-    current = await get_embeddings_model(conn, model_id)
-    if current is None:
-        return None
-
-    # Use provided values or keep current ones
-    new_description = model.description if model.description is not None else current.description
-    new_dimensions = model.dimensions if model.dimensions is not None else current.dimensions
-
-    await conn.execute(
-        "UPDATE embeddings_models SET description = $1, dimensions = $2 WHERE id = $3",
-        new_description,
-        new_dimensions,
+    # Use provided values or keep current ones, in a single statement
+    row = await conn.fetchrow(
+        """
+        UPDATE embeddings_models
+        SET description = COALESCE($1, description),
+            dimensions = COALESCE($2, dimensions)
+        WHERE id = $3
+        RETURNING id, description, dimensions
+        """,
+        model.description,
+        model.dimensions,
         model_id,
     )
-    return EmbeddingsModelResponse(id=model_id, description=new_description, dimensions=new_dimensions)
+    if row is None:
+        return None
+    return EmbeddingsModelResponse(id=row["id"], description=row["description"], dimensions=row["dimensions"])
 
 
 async def delete_embeddings_model(conn: asyncpg.Connection, model_id: str) -> bool:
     """Delete an embeddings model. Returns True if deleted, False if not found."""
-    result = await conn.execute(
-        "DELETE FROM embeddings_models WHERE id = $1",
+    deleted = await conn.fetchval(
+        "DELETE FROM embeddings_models WHERE id = $1 RETURNING id",
         model_id,
     )
-    return str(result) != "DELETE 0"
+    return deleted is not None
 
 
 async def upsert_embeddings_model(
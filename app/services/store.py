@@ -1,9 +1,13 @@
-import json
+import hashlib
 import re
 
 import asyncpg
+import orjson
 
+from app.core.config import get_settings
+from app.core.database import acquire
 from app.models.store import (
+    TABLE_NAME_PATTERN,
     StoreBatchEmbedResponse,
     StoreCreate,
     StoreEmbedRequest,
@@ -15,38 +19,101 @@ from app.models.store import (
 )
 from app.services.embeddings import get_embeddings_service
 
+settings = get_settings()
+
+# Supported column types for store embeddings, mapped to the HNSW operator class
+# for cosine distance and the max dimensions pgvector can index for that type
+EMBEDDING_TYPES: dict[str, tuple[str, int]] = {
+    "vector": ("vector_cosine_ops", 2000),
+    "halfvec": ("halfvec_cosine_ops", 4000),
+}
+
+# Compiled once; fullmatch also rejects a trailing newline, which "$" lets through
+_TABLE_NAME_RE = re.compile(TABLE_NAME_PATTERN)
+
+# Responses use model_construct: every field comes from our own tables or from
+# a request pydantic already validated, so checking it again is wasted work
+
+
+class StoreNotFoundError(Exception):
+    """Raised when an operation targets a store that does not exist."""
+
+    def __init__(self, store_id: str):
+        super().__init__(f"Store with id '{store_id}' not found")
+        self.store_id = store_id
+
 
 def _validate_table_name(name: str) -> str:
     """Validate and sanitize table name to prevent SQL injection."""
-    if not re.match(r"^[a-zA-Z_][a-zA-Z0-9_]*$", name):
+    if not _TABLE_NAME_RE.fullmatch(name):
         raise ValueError(f"Invalid table name: {name}")
     return name
 
 
+def _validate_embedding_type(embedding_type: str) -> str:
+    """Validate embedding column type before it is used in SQL."""
+    if embedding_type not in EMBEDDING_TYPES:
+        raise ValueError(f"Invalid embedding type: {embedding_type}")
+    return embedding_type
+
+
 async def create_store(
     conn: asyncpg.Connection, store: StoreCreate, dimensions: int
-) -> StoreResponse:
-    """Create a new store and its corresponding embeddings table."""
-    # Insert into stores table
-    await conn.execute(
-        "INSERT INTO stores (id, model, description) VALUES ($1, $2, $3)",
-        store.id,
-        store.model,
-        store.description,
-    )
+) -> StoreResponse | None:
+    """Create a new store and its corresponding embeddings table.
 
-    # Create dynamic table for embeddings with unique constraint on content
+    Returns None if a store with the same ID already exists.
+    """
+    embedding_type = _validate_embedding_type(settings.EMBEDDING_STORAGE_TYPE)
     table_name = _validate_table_name(store.id)
-    await conn.execute(f"""
+
+    # Dynamic table for embeddings with unique constraint on content, plus a GIN
+    # index for metadata containment filters in query_store
+    ddl = [
+        f"""
         CREATE TABLE IF NOT EXISTS {table_name} (
             id SERIAL PRIMARY KEY,
             content TEXT NOT NULL UNIQUE,
-            embedding vector({dimensions}),
-            metadata JSON
+            embedding {embedding_type}({dimensions}),
+            metadata JSONB
+        )
+        """,
+        f"""
+        CREATE INDEX IF NOT EXISTS {table_name}_metadata_idx
+        ON {table_name} USING gin (metadata jsonb_path_ops)
+        """,
+    ]
+    # HNSW index for cosine distance queries, if pgvector can index this many dimensions
+    ops_class, max_index_dimensions = EMBEDDING_TYPES[embedding_type]
+    if dimensions <= max_index_dimensions:
+        ddl.append(f"""
+            CREATE INDEX IF NOT EXISTS {table_name}_embedding_idx
+            ON {table_name} USING hnsw (embedding {ops_class})
+            WITH (m = {settings.HNSW_M}, ef_construction = {settings.HNSW_EF_CONSTRUCTION})
+        """)
+
+    # One transaction, so a failed CREATE doesn't leave a store without a table
+    async with conn.transaction():
+        inserted = await conn.fetchval(
+            """
+            INSERT INTO stores (id, model, description, embedding_type)
+            VALUES ($1, $2, $3, $4)
+            ON CONFLICT (id) DO NOTHING
+            RETURNING id
+            """,
+            store.id,
+            store.model,
+            store.description,
+            embedding_type,
         )
-    """)
+        if inserted is None:
+            return None
+        # Without arguments asyncpg sends every statement in a single message
+        await conn.execute(";".join(ddl))
 
-    return StoreResponse(id=store.id, model=store.model, description=store.description)
+    return StoreResponse.model_construct(
+        id=store.id, model=store.model, description=store.description
+    )
 
 
 async def get_store(
@@ -59,7 +126,9 @@ async def get_store(
     )
     if row is None:
         return None
-    return StoreResponse(id=row["id"], model=row["model"], description=row["description"])
+    return StoreResponse.model_construct(
+        id=row["id"], model=row["model"], description=row["description"]
+    )
 
 
 async def get_all_stores(
@@ -68,7 +137,9 @@ async def get_all_stores(
     """Get all stores."""
     rows = await conn.fetch("SELECT id, model, description FROM stores")
     return [
-        StoreResponse(id=row["id"], model=row["model"], description=row["description"])
+        StoreResponse.model_construct(
+            id=row["id"], model=row["model"], description=row["description"]
+        )
         for row in rows
     ]
 
@@ -77,44 +148,79 @@ async def update_store(
     conn: asyncpg.Connection, store_id: str, store: StoreUpdate
 ) -> StoreResponse | None:
     """Update an existing store."""
-    # First get current values
-    current = await get_store(conn, store_id)
-    if current is None:
-        return None
-
-    # Use provided values or keep current ones
-    new_model = store.model if store.model is not None else current.model
-    new_description = store.description if store.description is not None else current.description
-
-    await conn.execute(
-        "UPDATE stores SET model = $1, description = $2 WHERE id = $3",
-        new_model,
-        new_description,
+    # Use provided values or keep current ones, in a single statement
+    row = await conn.fetchrow(
+        """
+        UPDATE stores
+        SET model = COALESCE($1, model),
+            description = COALESCE($2, description)
+        WHERE id = $3
+        RETURNING id, model, description
+        """,
+        store.model,
+        store.description,
         store_id,
     )
-    return StoreResponse(id=store_id, model=new_model, description=new_description)
+    if row is None:
+        return None
+    await _invalidate_query_cache(conn, store_id)
+    return StoreResponse.model_construct(
+        id=row["id"], model=row["model"], description=row["description"]
+    )
 
 
 async def delete_store(conn: asyncpg.Connection, store_id: str) -> bool:
     """Delete a store. Returns True if deleted, False if not found."""
-    result = await conn.execute(
-        "DELETE FROM stores WHERE id = $1",
+    deleted = await conn.fetchval(
+        "DELETE FROM stores WHERE id = $1 RETURNING id",
         store_id,
     )
-    return str(result) != "DELETE 0"
+    return deleted is not None
+
+
+def _query_cache_key(
+    query: str,
+    limit: int,
+    max_distance: float | None,
+    metadata_filters: dict | None,
+) -> bytes:
+    """Hash everything that determines a query_store result."""
+    return hashlib.sha256(
+        orjson.dumps(
+            [query, limit, max_distance, metadata_filters],
+            option=orjson.OPT_SORT_KEYS,
+        )
+    ).digest()
+
+
+async def _invalidate_query_cache(conn: asyncpg.Connection, store_id: str) -> None:
+    """Drop a store's cached query results after its content or model changes."""
+    if settings.QUERY_CACHE_TTL_SECONDS > 0:
+        await conn.execute("DELETE FROM query_cache WHERE store_id = $1", store_id)
+
+
+async def _get_store_embedding_info(
+    conn: asyncpg.Connection, store_id: str
+) -> tuple[str, str]:
+    """Get a store's (model ID, embedding type). Raises StoreNotFoundError if missing."""
+    row = await conn.fetchrow(
+        "SELECT model, embedding_type FROM stores WHERE id = $1", store_id
+    )
+    if row is None:
+        raise StoreNotFoundError(store_id)
+    return row["model"], _validate_embedding_type(row["embedding_type"])
 
 
 async def embed_content(
-    conn: asyncpg.Connection,
+    pool: asyncpg.Pool,
     store_id: str,
-    model_id: str,
     content: str,
     query: str | None = None,
     metadata: dict | None = None,
 ) -> StoreEmbedResponse | None:
     """Embed content and store it in the store's table. Idempotent - skips duplicates.
 
-    Returns None if content is empty.
+    Returns None if content is empty. Raises StoreNotFoundError if the store doesn't exist.
     """
     # Skip empty content
     if not content or not content.strip():
@@ -122,16 +228,30 @@ async def embed_content(
 
     table_name = _validate_table_name(store_id)
 
-    # Check if content already exists
-    existing = await conn.fetchrow(
-        f"SELECT id FROM {table_name} WHERE content = $1",
-        content,
-    )
-
-    if existing:
+    # Look up the store's model and check if content already exists in one query
+    try:
+        async with acquire(pool) as conn:
+            store_row = await conn.fetchrow(
+                f"""
+                SELECT s.model, s.embedding_type, t.id
+                FROM stores s
+                LEFT JOIN {table_name} t ON t.content = $2
+                WHERE s.id = $1
+                """,
+                store_id,
+                content,
+            )
+    except asyncpg.UndefinedTableError:
+        raise StoreNotFoundError(store_id) from None
+    if store_row is None:
+        raise StoreNotFoundError(store_id)
+    model_id = store_row["model"]
+    embedding_type = _validate_embedding_type(store_row["embedding_type"])
+
+    if store_row["id"] is not None:
         # Content already exists, return existing record
         return StoreEmbedResponse(
-            id=existing["id"],
+            id=store_row["id"],
             content=content,
             dimensions=0,  # We don't re-fetch the embedding
             created=False,
@@ -142,21 +262,21 @@ async def embed_content(
     embeddings_service = get_embeddings_service()
     embedding_response = await embeddings_service.embed_query(model_id, text_to_embed)
 
-    # Convert embedding list to PostgreSQL vector format
-    embedding_str = "[" + ",".join(str(x) for x in embedding_response.embedding) + "]"
-
     # Insert into the store's table
-    metadata_json = json.dumps(metadata) if metadata else None
-    row = await conn.fetchrow(
-        f"""
-        INSERT INTO {table_name} (content, embedding, metadata)
-        VALUES ($1, $2::vector, $3::json)
-        RETURNING id
-        """,
-        content,
-        embedding_str,
-        metadata_json,
-    )
+    # asyncpg's jsonb codec takes str, so decode orjson's bytes
+    metadata_json = orjson.dumps(metadata).decode() if metadata else None
+    async with acquire(pool) as conn:
+        row = await conn.fetchrow(
+            f"""
+            INSERT INTO {table_name} (content, embedding, metadata)
+            VALUES ($1, $2::{embedding_type}, $3::jsonb)
+            RETURNING id
+            """,
+            content,
+            embedding_response.embedding,
+            metadata_json,
+        )
+        await _invalidate_query_cache(conn, store_id)
 
     return StoreEmbedResponse(
         id=row["id"],
@@ -167,13 +287,16 @@ async def embed_content(
 
 
 async def embed_content_batch(
-    conn: asyncpg.Connection,
+    pool: asyncpg.Pool,
     store_id: str,
-    model_id: str,
     items: list[StoreEmbedRequest],
 ) -> StoreBatchEmbedResponse:
-    """Embed multiple items and store them in the store's table. Idempotent - skips duplicates."""
+    """Embed multiple items and store them in the store's table. Idempotent - skips duplicates.
+
+    Raises StoreNotFoundError if the store doesn't exist.
+    """
     table_name = _validate_table_name(store_id)
+    # Responses are built from trusted DB/model values, skip Pydantic validation
     results: list[StoreEmbedResponse] = []
     created_count = 0
     skipped_count = 0
@@ -181,28 +304,44 @@ async def embed_content_batch(
     # Filter out items with empty content
     items = [item for item in items if item.content and item.content.strip()]
 
+    # Look up the store's model and existing content (to skip duplicates) in one query
+    contents = [item.content for item in items]
+    try:
+        async with acquire(pool) as conn:
+            store_rows = await conn.fetch(
+                f"""
+                SELECT s.model, s.embedding_type, t.id, t.content
+                FROM stores s
+                LEFT JOIN {table_name} t ON t.content = ANY($2)
+                WHERE s.id = $1
+                """,
+                store_id,
+                contents,
+            )
+    except asyncpg.UndefinedTableError:
+        raise StoreNotFoundError(store_id) from None
+    if not store_rows:
+        raise StoreNotFoundError(store_id)
+    model_id = store_rows[0]["model"]
+    embedding_type = _validate_embedding_type(store_rows[0]["embedding_type"])
+    existing_map = {
+        row["content"]: row["id"] for row in store_rows if row["id"] is not None
+    }
+
     if not items:
-        return StoreBatchEmbedResponse(
+        return StoreBatchEmbedResponse.model_construct(
             results=[],
             total=0,
             created=0,
             skipped=0,
         )
 
-    # Get existing content to skip duplicates
-    contents = [item.content for item in items]
-    existing_rows = await conn.fetch(
-        f"SELECT id, content FROM {table_name} WHERE content = ANY($1)",
-        contents,
-    )
-    existing_map = {row["content"]: row["id"] for row in existing_rows}
-
     # Separate new items from existing ones
     new_items: list[tuple[int, StoreEmbedRequest]] = []
     for idx, item in enumerate(items):
         if item.content in existing_map:
             results.append(
-                StoreEmbedResponse(
+                StoreEmbedResponse.model_construct(
                     id=existing_map[item.content],
                     content=item.content,
                     dimensions=0,
@@ -214,7 +353,7 @@ async def embed_content_batch(
             new_items.append((idx, item))
 
     if not new_items:
-        return StoreBatchEmbedResponse(
+        return StoreBatchEmbedResponse.model_construct(
             results=results,
             total=len(items),
             created=created_count,
@@ -230,28 +369,49 @@ async def embed_content_batch(
 
     dimensions = embeddings_response.dimensions
 
-    # Insert new items
-    for i, (original_idx, item) in enumerate(new_items):
-        embedding = embeddings_response.embeddings[i].embedding
-        embedding_str = "[" + ",".join(str(x) for x in embedding) + "]"
-        metadata_json = json.dumps(item.metadata) if item.metadata else None
-
-        row = await conn.fetchrow(
+    # Insert all new items with a single statement instead of one INSERT per item
+    async with acquire(pool) as conn:
+        inserted_rows = await conn.fetch(
             f"""
             INSERT INTO {table_name} (content, embedding, metadata)
-            VALUES ($1, $2::vector, $3::json)
+            SELECT content, embedding, metadata::jsonb
+            FROM unnest($1::text[], $2::{embedding_type}[], $3::text[])
+                AS t(content, embedding, metadata)
             ON CONFLICT (content) DO NOTHING
-            RETURNING id
+            RETURNING id, content
             """,
-            item.content,
-            embedding_str,
-            metadata_json,
+            [item.content for _, item in new_items],
+            [emb.embedding for emb in embeddings_response.embeddings],
+            [
+                orjson.dumps(item.metadata).decode() if item.metadata else None
+                for _, item in new_items
+            ],
         )
+        if inserted_rows:
+            await _invalidate_query_cache(conn, store_id)
+        inserted_map = {row["content"]: row["id"] for row in inserted_rows}
+        row_ids = [inserted_map.pop(item.content, None) for _, item in new_items]
+
+        # Race condition - content was inserted by another request (or is
+        # repeated within this batch), look all of it up in one query
+        conflicting = [
+            item.content
+            for (_, item), row_id in zip(new_items, row_ids, strict=True)
+            if row_id is None
+        ]
+        existing_ids: dict[str, int] = {}
+        if conflicting:
+            existing_rows = await conn.fetch(
+                f"SELECT id, content FROM {table_name} WHERE content = ANY($1)",
+                conflicting,
+            )
+            existing_ids = {row["content"]: row["id"] for row in existing_rows}
 
-        if row:
+    for (_, item), row_id in zip(new_items, row_ids, strict=True):
+        if row_id is not None:
             results.append(
-                StoreEmbedResponse(
-                    id=row["id"],
+                StoreEmbedResponse.model_construct(
+                    id=row_id,
                     content=item.content,
                     dimensions=dimensions,
                     created=True,
@@ -259,14 +419,9 @@ async def embed_content_batch(
             )
             created_count += 1
         else:
-            # Race condition - content was inserted by another request
-            existing = await conn.fetchrow(
-                f"SELECT id FROM {table_name} WHERE content = $1",
-                item.content,
-            )
             results.append(
-                StoreEmbedResponse(
-                    id=existing["id"] if existing else 0,
+                StoreEmbedResponse.model_construct(
+                    id=existing_ids.get(item.content, 0),
                     content=item.content,
                     dimensions=0,
                     created=False,
@@ -274,7 +429,7 @@ async def embed_content_batch(
             )
             skipped_count += 1
 
-    return StoreBatchEmbedResponse(
+    return StoreBatchEmbedResponse.model_construct(
         results=results,
         total=len(items),
         created=created_count,
@@ -282,48 +437,66 @@ async def embed_content_batch(
     )
 
 
-def _validate_metadata_key(key: str) -> str:
-    """Validate metadata key to prevent SQL injection."""
-    if not re.match(r"^[a-zA-Z_][a-zA-Z0-9_]*$", key):
-        raise ValueError(f"Invalid metadata key: {key}")
-    return key
-
-
 async def query_store(
-    conn: asyncpg.Connection,
+    pool: asyncpg.Pool,
     store_id: str,
-    model_id: str,
     query: str,
     limit: int = 10,
     max_distance: float | None = None,
     metadata_filters: dict | None = None,
 ) -> StoreQueryResponse:
-    """Query the store for the most similar content to the query."""
+    """Query the store for the most similar content to the query.
+
+    Raises StoreNotFoundError if the store doesn't exist.
+    """
     table_name = _validate_table_name(store_id)
+    cache_ttl = settings.QUERY_CACHE_TTL_SECONDS
+    query_hash = _query_cache_key(query, limit, max_distance, metadata_filters)
+
+    async with acquire(pool) as conn:
+        if cache_ttl > 0:
+            cached = await conn.fetchval(
+                """
+                SELECT results FROM query_cache
+                WHERE store_id = $1 AND query_hash = $2
+                    AND created_at > now() - make_interval(secs => $3)
+                """,
+                store_id,
+                query_hash,
+                cache_ttl,
+            )
+            if cached is not None:
+                cached_results = [
+                    StoreQueryResult.model_construct(**result)
+                    for result in orjson.loads(cached)
+                ]
+                return StoreQueryResponse.model_construct(
+                    query=query,
+                    results=cached_results,
+                    count=len(cached_results),
+                )
+        model_id, embedding_type = await _get_store_embedding_info(conn, store_id)
 
     # Create embedding for the query
     embeddings_service = get_embeddings_service()
     embedding_response = await embeddings_service.embed_query(model_id, query)
 
-    # Convert embedding list to PostgreSQL vector format
-    embedding_str = "[" + ",".join(str(x) for x in embedding_response.embedding) + "]"
-
     # Build WHERE clause
     where_conditions = []
-    params = [embedding_str]
+    params: list[object] = [embedding_response.embedding]
     param_idx = 2
 
     if max_distance is not None:
-        where_conditions.append(f"embedding <=> $1::vector <= ${param_idx}")
+        where_conditions.append(f"embedding <=> $1::{embedding_type} <= ${param_idx}")
         params.append(max_distance)
         param_idx += 1
 
     if metadata_filters:
-        for key, value in metadata_filters.items():
-            validated_key = _validate_metadata_key(key)
-            where_conditions.append(f"metadata ->> '{validated_key}' = ${param_idx}")
-            params.append(str(value))
-            param_idx += 1
+        # Containment is answered by the metadata GIN index; the filters travel as
+        # a parameter, so keys never reach the SQL text
+        where_conditions.append(f"metadata @> ${param_idx}::jsonb")
+        params.append(orjson.dumps(metadata_filters).decode())
+        param_idx += 1
 
     where_clause = ""
     if where_conditions:
@@ -332,27 +505,68 @@ async def query_store(
     params.append(limit)
     limit_param = f"${param_idx}"
 
-    rows = await conn.fetch(
-        f"""
-        SELECT id, content, embedding <=> $1::vector AS distance
-        FROM {table_name}
-        {where_clause}
-        ORDER BY distance
-        LIMIT {limit_param}
-        """,
-        *params,
-    )
+    # The HNSW scan returns at most ef_search candidates; pgvector caps it at 1000
+    ef_search = min(max(limit * settings.HNSW_EF_SEARCH_MULTIPLIER, 40), 1000)
+
+    async with acquire(pool) as conn, conn.transaction():
+        if where_conditions and settings.HNSW_ITERATIVE_SCAN != "off":
+            # Filters are applied to the ef_search candidates the index returns,
+            # so a selective filter could leave fewer than limit rows; an
+            # iterative scan keeps searching the index until limit rows match
+            await conn.execute(
+                """
+                SELECT set_config('hnsw.ef_search', $1, true),
+                    set_config('hnsw.iterative_scan', $2, true)
+                """,
+                str(ef_search),
+                settings.HNSW_ITERATIVE_SCAN,
+            )
+        else:
+            await conn.execute(
+                "SELECT set_config('hnsw.ef_search', $1, true)", str(ef_search)
+            )
+        rows = await conn.fetch(
+            f"""
+            SELECT id, content, embedding <=> $1::{embedding_type} AS distance
+            FROM {table_name}
+            {where_clause}
+            ORDER BY distance
+            LIMIT {limit_param}
+            """,
+            *params,
+        )
+        if cache_ttl > 0:
+            # Expired entries are evicted as new ones are written, so the table
+            # doesn't grow with every distinct query ever asked; the entry being
+            # written is left to the upsert
+            await conn.execute(
+                """
+                WITH expired AS (
+                    DELETE FROM query_cache
+                    WHERE created_at <= now() - make_interval(secs => $4)
+                        AND NOT (store_id = $1 AND query_hash = $2)
+                )
+                INSERT INTO query_cache (store_id, query_hash, results)
+                VALUES ($1, $2, $3::jsonb)
+                ON CONFLICT (store_id, query_hash)
+                DO UPDATE SET results = EXCLUDED.results, created_at = now()
+                """,
+                store_id,
+                query_hash,
+                orjson.dumps([dict(row) for row in rows]).decode(),
+                cache_ttl,
+            )
 
     results = [
-        StoreQueryResult(
+        StoreQueryResult.model_construct(
             id=row["id"],
             content=row["content"],
-            distance=float(row["distance"]),
+            distance=row["distance"],
         )
         for row in rows
     ]
 
-    return StoreQueryResponse(
+    return StoreQueryResponse.model_construct(
         query=query,
         results=results,
         count=len(results),
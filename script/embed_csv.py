@@ -1,12 +1,78 @@
 #!/usr/bin/env python3
-"""Convert CSV file to shell script with curl API call."""
+"""Convert CSV file to shell script with a single curl call sending all batches."""
 
 import argparse
 import csv
-import json
-import shlex
+from collections.abc import Iterator
+from itertools import batched
 from pathlib import Path
 
+import orjson
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+
+# Ends the heredocs in the generated script; JSON payloads and curl config
+# lines never equal it
+BATCH_DELIMITER = "BATCH"
+
+
+def batch_file_name(index: int) -> str:
+    """Name of the file the generated script writes a batch's payload to."""
+    return f"batch_{index:04d}.json"
+
+
+def iter_items(csv_path: Path) -> Iterator[dict]:
+    """Yield batch embed items from the CSV rows following the header."""
+    # Only the header's field count is needed: columns are picked by position,
+    # so duplicate names can't collide. utf-8-sig drops a BOM left by Excel
+    with open(csv_path, newline="", encoding="utf-8-sig") as f:
+        header = next(csv.reader(f), [])
+    columns = [f"column_{i}" for i in range(len(header))]
+    if not columns:
+        return
+
+    # Arrow's streaming reader parses the file block by block in native code,
+    # which is much faster than csv.reader for large inputs. Every column is
+    # read as a string, and rows with more or fewer fields than the header are
+    # skipped
+    reader = pa_csv.open_csv(
+        csv_path,
+        read_options=pa_csv.ReadOptions(column_names=columns, skip_rows_after_names=1),
+        parse_options=pa_csv.ParseOptions(
+            newlines_in_values=True,
+            invalid_row_handler=lambda row: "skip",
+        ),
+        convert_options=pa_csv.ConvertOptions(
+            column_types={name: pa.string() for name in columns[:2]},
+            include_columns=columns[:2],
+        ),
+    )
+    for block in reader:
+        # Single column - use value only for content
+        if len(columns) == 1:
+            for content in block.column(0).to_pylist():
+                yield {"content": content}
+        else:
+            # Two columns: first is content, query is content + ". " + second
+            contents = block.column(0)
+            queries = pc.binary_join_element_wise(contents, block.column(1), ". ")
+            for content, query in zip(
+                contents.to_pylist(), queries.to_pylist(), strict=True
+            ):
+                yield {"content": content, "query": query}
+
+
+def positive_int(value: str) -> int:
+    """Parse a command-line argument that must be a positive integer."""
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"not an integer: {value}") from None
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return number
+
 
 def main():
     parser = argparse.ArgumentParser(
@@ -22,6 +88,18 @@ def main():
         default="input/content.csv",
         help="Path to CSV file (default: input/content.csv)",
     )
+    parser.add_argument(
+        "--batch-size",
+        type=positive_int,
+        default=50,
+        help="Items per request; larger batches mean fewer requests (default: 50)",
+    )
+    parser.add_argument(
+        "--parallel",
+        type=positive_int,
+        default=1,
+        help="Requests curl sends at the same time (default: 1, one after another)",
+    )
     args = parser.parse_args()
 
     csv_path = Path(args.csv_file)
@@ -29,40 +107,43 @@ def main():
         print(f"Error: File not found: {csv_path}")
         return 1
 
-    results = []
-    with open(csv_path, newline="", encoding="utf-8") as f:
-        reader = csv.reader(f)
-        headers = next(reader)
+    # Rows are read and printed one batch at a time, so memory stays flat
+    # regardless of the CSV size. Each batch is written to its own file in a
+    # temporary directory; passing the payloads to curl as arguments or inline
+    # config values runs into argument and config line size limits
+    print("""#!/bin/bash
+set -e
+batch_dir=$(mktemp -d)
+trap 'rm -rf "$batch_dir"' EXIT""")
+    batch_count = 0
+    for batch in batched(iter_items(csv_path), args.batch_size):
+        payload = orjson.dumps({"items": batch}).decode()
+        print(f"""cat > "$batch_dir/{batch_file_name(batch_count)}" <<'{BATCH_DELIMITER}'
+{payload}
+{BATCH_DELIMITER}""")
+        batch_count += 1
+    if batch_count == 0:
+        return 0
 
-        # Single column - use value only for content
-        if len(headers) == 1:
-            for row in reader:
-                if row:
-                    results.append({"content": row[0]})
-        else:
-            # Two columns: first is content, query is content + ". " + second
-            for row in reader:
-                if len(row) >= 2:
-                    content = row[0]
-                    query = f"{row[0]}. {row[1]}"
-                    results.append({"content": content, "query": query})
-
-    # Split into batches of 50
-    batch_size = 50
-    batches = [results[i:i + batch_size] for i in range(0, len(results), batch_size)]
-
-    curl_commands = []
-    for batch in batches:
-        payload = json.dumps({"items": batch})
-        escaped_payload = shlex.quote(payload)
-        curl_commands.append(f"""curl -X 'POST' \\
-  'http://localhost:8000/v1/stores/{args.store_id}/embed/batch' \\
-  -H 'accept: application/json' \\
-  -H 'Content-Type: application/json' \\
-  -d {escaped_payload}""")
-
-    print("#!/bin/bash")
-    print(" && \\\n".join(curl_commands))
+    # A single curl process sends every batch, separated by "next", so the
+    # connection to the service is reused; --fail-early stops at the first
+    # failed request like a chain of && would
+    curl_options = "--fail-early"
+    if args.parallel > 1:
+        curl_options += f" --parallel --parallel-max {args.parallel}"
+    url = f"http://localhost:8000/v1/stores/{args.store_id}/embed/batch"
+    print(f"""cd "$batch_dir"
+curl {curl_options} --config - <<'{BATCH_DELIMITER}'""")
+    for i in range(batch_count):
+        if i > 0:
+            print("next")
+        print(f"""url = "{url}"
+request = "POST"
+header = "accept: application/json"
+header = "Content-Type: application/json"
+fail-with-body
+data = @{batch_file_name(i)}""")
+    print(BATCH_DELIMITER)
     return 0
 
 
@@ -0,0 +1,45 @@
+import struct
+
+import pytest
+
+from app.core.database import (
+    _decode_halfvec,
+    _decode_vector,
+    _encode_halfvec,
+    _encode_vector,
+)
+
+
+def test_vector_binary_layout():
+    data = _encode_vector([1.0, -2.5])
+
+    # dim, unused, then big-endian float4 values
+    assert data == struct.pack(">HHff", 2, 0, 1.0, -2.5)
+
+
+def test_halfvec_binary_layout():
+    data = _encode_halfvec([1.0, -2.5])
+
+    # dim, unused, then big-endian float2 values
+    assert data == struct.pack(">HHee", 2, 0, 1.0, -2.5)
+
+
+@pytest.mark.parametrize(
+    ("encode", "decode"),
+    [(_encode_vector, _decode_vector), (_encode_halfvec, _decode_halfvec)],
+)
+def test_round_trip(encode, decode):
+    values = [0.0, 0.5, -1.25, 3.0]
+
+    assert decode(encode(values)) == values
+
+
+def test_round_trip_empty():
+    assert _decode_vector(_encode_vector([])) == []
+
+
+def test_halfvec_rounds_to_half_precision():
+    (value,) = _decode_halfvec(_encode_halfvec([0.1]))
+
+    assert value == pytest.approx(0.1, abs=1e-4)
+    assert value != 0.1
@@ -0,0 +1,169 @@
+import importlib.util
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import orjson
+import pytest
+
+SCRIPT_PATH = Path(__file__).parent.parent / "script" / "embed_csv.py"
+
+spec = importlib.util.spec_from_file_location("embed_csv", SCRIPT_PATH)
+assert spec is not None and spec.loader is not None
+embed_csv = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(embed_csv)
+
+
+@pytest.fixture
+def write_csv(tmp_path: Path):
+    def write(content: str | bytes) -> Path:
+        path = tmp_path / "input.csv"
+        if isinstance(content, str):
+            content = content.encode()
+        path.write_bytes(content)
+        return path
+
+    return write
+
+
+def test_single_column_uses_value_as_content(write_csv):
+    path = write_csv("content\nfirst\n007\n\nsecond\n")
+
+    assert list(embed_csv.iter_items(path)) == [
+        {"content": "first"},
+        {"content": "007"},
+        {"content": "second"},
+    ]
+
+
+def test_two_columns_build_query_from_both(write_csv):
+    path = write_csv('title,description\nDune,"Sand, spice"\n"Two\nlines",x\n')
+
+    assert list(embed_csv.iter_items(path)) == [
+        {"content": "Dune", "query": "Dune. Sand, spice"},
+        {"content": "Two\nlines", "query": "Two\nlines. x"},
+    ]
+
+
+def test_utf8_bom_is_ignored(write_csv):
+    path = write_csv(b"\xef\xbb\xbfcontent,query\nx,y\n")
+
+    assert list(embed_csv.iter_items(path)) == [{"content": "x", "query": "x. y"}]
+
+
+def test_duplicate_header_names_use_columns_by_position(write_csv):
+    path = write_csv("a,a\nx,y\n")
+
+    assert list(embed_csv.iter_items(path)) == [{"content": "x", "query": "x. y"}]
+
+
+def test_header_with_quoted_newline_is_skipped_as_one_row(write_csv):
+    path = write_csv('"multi\nline",query\nx,y\n')
+
+    assert list(embed_csv.iter_items(path)) == [{"content": "x", "query": "x. y"}]
+
+
+@pytest.mark.parametrize(
+    "content",
+    [
+        "content,query\nshort\nx,y\nlong,row,here\n",
+        "content,query,extra\nshort,row\nx,y,z\n",
+        "content\nx\nlong,row\n",
+    ],
+)
+def test_rows_with_wrong_field_count_are_skipped(write_csv, content):
+    items = list(embed_csv.iter_items(write_csv(content)))
+
+    assert [item["content"] for item in items] == ["x"]
+
+
+def test_header_only_yields_nothing(write_csv):
+    assert list(embed_csv.iter_items(write_csv("content,query\n"))) == []
+    assert list(embed_csv.iter_items(write_csv(""))) == []
+
+
+def generate_script(monkeypatch, capsys, *args: str) -> str:
+    """Run embed_csv.py's main with the given arguments and return its output."""
+    monkeypatch.setattr(sys, "argv", ["embed_csv.py", *args])
+    assert embed_csv.main() == 0
+    return capsys.readouterr().out
+
+
+def test_script_writes_one_file_per_batch(write_csv, monkeypatch, capsys):
+    path = write_csv("content\na\nb\nc\n")
+
+    script = generate_script(
+        monkeypatch, capsys, "my_store", str(path), "--batch-size", "2"
+    )
+
+    assert script.startswith("#!/bin/bash\n")
+    payloads = [orjson.loads(line) for line in script.splitlines() if line[:1] == "{"]
+    assert payloads == [
+        {"items": [{"content": "a"}, {"content": "b"}]},
+        {"items": [{"content": "c"}]},
+    ]
+    assert "curl --fail-early --config - <<'BATCH'" in script
+    assert (
+        script.count('url = "http://localhost:8000/v1/stores/my_store/embed/batch"')
+        == 2
+    )
+    assert "data = @batch_0000.json\nnext\n" in script
+    assert script.endswith("data = @batch_0001.json\nBATCH\n")
+
+
+def test_script_parallel_option(write_csv, monkeypatch, capsys):
+    path = write_csv("content\na\n")
+
+    script = generate_script(monkeypatch, capsys, "s", str(path), "--parallel", "4")
+
+    assert "curl --fail-early --parallel --parallel-max 4 --config -" in script
+
+
+def test_script_without_rows_sends_nothing(write_csv, monkeypatch, capsys):
+    path = write_csv("content\n")
+
+    script = generate_script(monkeypatch, capsys, "s", str(path))
+
+    assert "curl" not in script
+
+
+@pytest.mark.parametrize("value", ["0", "-1", "x"])
+def test_batch_size_must_be_positive(monkeypatch, value):
+    monkeypatch.setattr(sys, "argv", ["embed_csv.py", "s", "--batch-size", value])
+
+    with pytest.raises(SystemExit):
+        embed_csv.main()
+
+
+def test_generated_script_passes_batches_to_curl(
+    write_csv, monkeypatch, capsys, tmp_path
+):
+    path = write_csv('title,description\nDune,"It\'s ""sand"", \\ $HOME"\nEmma,x\n')
+    script = generate_script(monkeypatch, capsys, "s", str(path), "--batch-size", "1")
+    # Stub curl that records its arguments, its config and the batch files
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    curl = bin_dir / "curl"
+    curl.write_text(
+        "#!/bin/bash\n"
+        'echo "$@" > "$OUT/args"\n'
+        'cat > "$OUT/config"\n'
+        'cat batch_0000.json batch_0001.json > "$OUT/payloads"\n'
+    )
+    curl.chmod(0o755)
+    env = {
+        **os.environ,
+        "PATH": f"{bin_dir}:{os.environ['PATH']}",
+        "OUT": str(tmp_path),
+    }
+
+    subprocess.run(["bash", "-c", script], check=True, env=env)
+
+    assert (tmp_path / "args").read_text() == "--fail-early --config -\n"
+    assert (tmp_path / "config").read_text().count("next") == 1
+    payloads = (tmp_path / "payloads").read_text().splitlines()
+    assert [orjson.loads(payload) for payload in payloads] == [
+        {"items": [{"content": "Dune", "query": 'Dune. It\'s "sand", \\ $HOME'}]},
+        {"items": [{"content": "Emma", "query": "Emma. x"}]},
+    ]
@@ -0,0 +1,179 @@
+import asyncio
+from collections.abc import AsyncIterator, Callable
+from typing import Any
+
+import httpx
+import orjson
+import pytest
+
+from app.services.embeddings import EmbeddingsService
+
+MODEL = "nomic-embed-text"
+
+
+class FakeOllama:
+    """Ollama /api/embed stand-in that records every request's inputs."""
+
+    def __init__(self, fail_on: str | None = None, delay: float = 0) -> None:
+        self.requests: list[list[str]] = []
+        self.fail_on = fail_on
+        self.delay = delay
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        texts: list[str] = orjson.loads(request.content)["input"]
+        self.requests.append(texts)
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.fail_on in texts:
+            return httpx.Response(500, json={"error": "bad input"})
+        return httpx.Response(
+            200, json={"embeddings": [[float(len(text))] for text in texts]}
+        )
+
+
+@pytest.fixture
+async def make_service() -> AsyncIterator[
+    Callable[..., tuple[EmbeddingsService, FakeOllama]]
+]:
+    """Build services whose Ollama client talks to a FakeOllama."""
+    services: list[EmbeddingsService] = []
+
+    def make(
+        ollama: FakeOllama | None = None, **kwargs: Any
+    ) -> tuple[EmbeddingsService, FakeOllama]:
+        ollama = ollama or FakeOllama()
+        service = EmbeddingsService(**kwargs)
+        service._ollama_client = httpx.AsyncClient(
+            base_url="http://ollama", transport=httpx.MockTransport(ollama.handle)
+        )
+        services.append(service)
+        return service, ollama
+
+    yield make
+    for service in services:
+        await service.aclose()
+
+
+async def test_failed_query_does_not_fail_its_batch(make_service):
+    service, ollama = make_service(FakeOllama(fail_on="bad"))
+
+    good, bad = await asyncio.gather(
+        service.embed_query(MODEL, "good"),
+        service.embed_query(MODEL, "bad"),
+        return_exceptions=True,
+    )
+
+    assert good.embedding == [4.0]
+    assert isinstance(bad, httpx.HTTPStatusError)
+    # The batch failed, then each query was retried on its own
+    assert ollama.requests == [["good", "bad"], ["good"], ["bad"]]
+
+
+async def test_concurrent_queries_share_one_request(make_service):
+    service, ollama = make_service()
+
+    results = await asyncio.gather(
+        *(service.embed_query(MODEL, "x" * n) for n in range(1, 4))
+    )
+
+    assert [r.embedding for r in results] == [[1.0], [2.0], [3.0]]
+    assert ollama.requests == [["x", "xx", "xxx"]]
+
+
+async def test_batch_is_sent_once_max_size_is_reached(make_service):
+    # A window this long would time the test out if the size limit didn't flush
+    service, ollama = make_service(batch_window_ms=60_000, max_batch_size=2)
+
+    results = await asyncio.wait_for(
+        asyncio.gather(
+            service.embed_query(MODEL, "a"), service.embed_query(MODEL, "bb")
+        ),
+        timeout=1,
+    )
+
+    assert [r.embedding for r in results] == [[1.0], [2.0]]
+    assert ollama.requests == [["a", "bb"]]
+
+
+async def test_queries_outside_the_window_are_sent_separately(make_service):
+    service, ollama = make_service(batch_window_ms=1)
+
+    await service.embed_query(MODEL, "a")
+    await service.embed_query(MODEL, "b")
+
+    assert ollama.requests == [["a"], ["b"]]
+
+
+async def test_identical_concurrent_queries_are_embedded_once(make_service):
+    service, ollama = make_service()
+
+    results = await asyncio.gather(
+        *(service.embed_query(MODEL, "same") for _ in range(5))
+    )
+
+    assert all(r.embedding == [4.0] for r in results)
+    assert ollama.requests == [["same"]]
+
+
+async def test_cancelled_caller_does_not_cancel_shared_query(make_service):
+    service, ollama = make_service(FakeOllama(delay=0.05))
+
+    first = asyncio.create_task(service.embed_query(MODEL, "same"))
+    second = asyncio.create_task(service.embed_query(MODEL, "same"))
+    await asyncio.sleep(0.01)
+    first.cancel()
+
+    assert (await second).embedding == [4.0]
+    with pytest.raises(asyncio.CancelledError):
+        await first
+    assert ollama.requests == [["same"]]
+
+
+async def test_query_is_served_from_cache(make_service):
+    service, ollama = make_service()
+
+    first = await service.embed_query(MODEL, "cached")
+    second = await service.embed_query(MODEL, "cached")
+
+    assert first.embedding == second.embedding == [6.0]
+    assert ollama.requests == [["cached"]]
+
+
+async def test_normalized_cache_ignores_case_and_whitespace(make_service):
+    service, ollama = make_service(cache_normalize=True)
+
+    await service.embed_query(MODEL, "Hello  world")
+    response = await service.embed_query(MODEL, " hello world ")
+
+    assert response.embedding == [12.0]
+    assert ollama.requests == [["Hello  world"]]
+
+
+async def test_documents_only_embed_cache_misses_in_order(make_service):
+    service, ollama = make_service()
+    await service.embed_documents(MODEL, ["bb", "dddd"])
+
+    response = await service.embed_documents(MODEL, ["a", "bb", "ccc", "dddd"])
+
+    assert ollama.requests == [["bb", "dddd"], ["a", "ccc"]]
+    assert [e.embedding for e in response.embeddings] == [[1.0], [2.0], [3.0], [4.0]]
+    assert [e.index for e in response.embeddings] == [0, 1, 2, 3]
+    assert response.count == 4
+    assert response.dimensions == 1
+
+
+async def test_documents_and_queries_are_cached_separately(make_service):
+    service, ollama = make_service()
+
+    await service.embed_documents(MODEL, ["text"])
+    await service.embed_query(MODEL, "text")
+
+    # Vertex AI embeds documents and queries differently, so they never share
+    assert ollama.requests == [["text"], ["text"]]
+
+
+async def test_ollama_error_message_is_kept(make_service):
+    service, _ = make_service(FakeOllama(fail_on="bad"))
+
+    with pytest.raises(httpx.HTTPStatusError, match="Ollama returned 500: bad input"):
+        await service.embed_query(MODEL, "bad")